@@ -56,6 +56,9 @@ ORS_API_KEY = os.environ.get("ORS_API_KEY", "").strip()
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compress responses (mainly the route JSON); keep above anything that
+    # reads or rewrites the response body
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fuel_route.settings')
 
 application = get_wsgi_application()
+
+# Load fuel data (and compile the search kernel) before the first request
+# rather than during it, while other requests wait on the load lock.
+# Done here, not in AppConfig.ready(), so manage.py commands stay fast.
+try:
+    from route_planner.fuel_service import load_fuel_data
+
+    load_fuel_data()
+except Exception:
+    # A broken data file shouldn't stop the server from booting; the
+    # optimize endpoint retries the load and reports the error itself
+    pass
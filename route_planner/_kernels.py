@@ -0,0 +1,125 @@
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to plain NumPy
+    njit = None
+
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def _nearest_cheap_numpy(lat_w, lon_w, offsets, cand, lat_s, lon_s, cos_s, price, radius, top_n):
+    """NumPy version of nearest_cheap, used when numba is not installed."""
+    n_points = len(lat_w)
+    out_idx = np.full((n_points, top_n), -1, dtype=np.intp)
+    out_dist = np.zeros((n_points, top_n), dtype=np.float64)
+    if len(cand) == 0:
+        return out_idx, out_dist
+
+    point_idx = np.repeat(np.arange(n_points), np.diff(offsets))
+    pw_lat = lat_w[point_idx]
+    a = (
+        np.sin((lat_s[cand] - pw_lat) / 2) ** 2
+        + np.cos(pw_lat) * cos_s[cand]
+        * np.sin((lon_s[cand] - lon_w[point_idx]) / 2) ** 2
+    )
+    distances = EARTH_RADIUS_MILES * 2 * np.arcsin(np.sqrt(a))
+
+    within = distances <= radius
+    point_idx = point_idx[within]
+    stop_idx = cand[within]
+    distances = distances[within]
+
+    # Group by point, then price, then distance; keep the first top_n per group
+    order = np.lexsort((distances, price[stop_idx], point_idx))
+    sorted_points = point_idx[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_points, sorted_points)
+    keep = order[rank < top_n]
+    out_idx[point_idx[keep], rank[rank < top_n]] = stop_idx[keep]
+    out_dist[point_idx[keep], rank[rank < top_n]] = distances[keep]
+    return out_idx, out_dist
+
+
+if njit is not None:
+    # Serial on purpose: with only a handful of waypoints per route, prange's
+    # thread dispatch costs more than it saves, and numba's default
+    # workqueue threading layer aborts the process when parallel kernels
+    # are entered from several request threads at once.
+    @njit(fastmath=True, cache=True)
+    def _nearest_cheap_jit(lat_w, lon_w, offsets, cand, lat_s, lon_s, cos_s, price, radius, top_n):
+        n_points = lat_w.shape[0]
+        out_idx = np.full((n_points, top_n), -1, dtype=np.intp)
+        # d below is float64 (EARTH_RADIUS_MILES is a Python float); storing
+        # it narrower would let rounding noise reorder equal-distance ties
+        out_dist = np.zeros((n_points, top_n), dtype=np.float64)
+        for w in range(n_points):
+            lat1 = lat_w[w]
+            lon1 = lon_w[w]
+            cos_lat1 = math.cos(lat1)
+            n = 0
+            for j in range(offsets[w], offsets[w + 1]):
+                s = cand[j]
+                # Candidates come in price order: once the buffer is full,
+                # nothing pricier than its last entry can get in
+                if n == top_n and price[s] > price[out_idx[w, n - 1]]:
+                    break
+                a = (
+                    math.sin((lat_s[s] - lat1) / 2) ** 2
+                    + cos_lat1 * cos_s[s] * math.sin((lon_s[s] - lon1) / 2) ** 2
+                )
+                d = EARTH_RADIUS_MILES * 2 * math.asin(math.sqrt(a))
+                if d > radius:
+                    continue
+
+                # Insert into the small (price, distance)-sorted top_n buffer;
+                # ties keep the earlier candidate first
+                p = price[s]
+                pos = n
+                while pos > 0:
+                    prev = out_idx[w, pos - 1]
+                    if p < price[prev] or (p == price[prev] and d < out_dist[w, pos - 1]):
+                        pos -= 1
+                    else:
+                        break
+                if pos >= top_n:
+                    continue
+                for k in range(min(n, top_n - 1), pos, -1):
+                    out_idx[w, k] = out_idx[w, k - 1]
+                    out_dist[w, k] = out_dist[w, k - 1]
+                out_idx[w, pos] = s
+                out_dist[w, pos] = d
+                if n < top_n:
+                    n += 1
+        return out_idx, out_dist
+
+
+def nearest_cheap(lat_w, lon_w, offsets, cand, lat_s, lon_s, cos_s, price, radius, top_n):
+    """
+    Haversine + radius filter + top_n cheapest selection in one pass.
+    Candidates for waypoint w are cand[offsets[w]:offsets[w + 1]] (indices
+    into the stop arrays, ascending). The stop arrays must be sorted by
+    price so the scan can stop once top_n cheaper stops are found.
+    All angles are in radians.
+    Returns (indices, distances), both shaped (n_waypoints, top_n), sorted
+    by price then distance; unused slots have index -1.
+    """
+    kernel = _nearest_cheap_jit if njit is not None else _nearest_cheap_numpy
+    return kernel(
+        lat_w, lon_w, offsets, cand, lat_s, lon_s, cos_s, price,
+        float(radius), int(top_n),
+    )
+
+
+def warm_up(lat_s, lon_s, cos_s, price):
+    """
+    Compile the kernel for the given stop array dtypes with a dummy call,
+    so the first real request does not pay the JIT cost.
+    """
+    lat_w = np.zeros(1, dtype=lat_s.dtype)
+    nearest_cheap(
+        lat_w, lat_w, np.zeros(2, dtype=np.intp), np.empty(0, dtype=np.intp),
+        lat_s, lon_s, cos_s, price, 1.0, 1,
+    )
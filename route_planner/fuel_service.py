@@ -1,13 +1,44 @@
-import json
+import math
 import os
+import tempfile
+import threading
+import zipfile
 from functools import lru_cache
+from typing import NamedTuple
 
 import numpy as np
+import orjson
 import pandas as pd
 from django.conf import settings
+from scipy.spatial import cKDTree
 
+from ._kernels import nearest_cheap, warm_up
 
+
+FUEL_CSV_PATH = os.path.join(settings.BASE_DIR, "data", "fuel_prices.csv")
 GEOCODED_JSON_PATH = os.path.join(settings.BASE_DIR, "data", "fuel_geocoded.json")
+GEOCODED_NPZ_PATH = os.path.join(settings.BASE_DIR, "data", "fuel_geocoded.npz")
+EARTH_RADIUS_MILES = 3958.8
+DEFAULT_CENTROID = (39.5, -98.35)
+
+
+class _FuelStops(NamedTuple):
+    """
+    One consistent snapshot of the fuel data, swapped in as a whole on reload.
+    Structure-of-arrays view: row i of every array describes the same stop
+    as rows[i]; rows are sorted by price, cheapest first.
+    """
+    df: pd.DataFrame
+    tree: cKDTree  # stops as 3D points on the unit sphere
+    lat_rad: np.ndarray
+    lon_rad: np.ndarray
+    cos_lat: np.ndarray
+    price: np.ndarray
+    rows: tuple
+
+
+# Serializes cache lookups so a reload is built once, not once per thread
+_LOAD_LOCK = threading.Lock()
 
 
 def load_geocoded_dict():
@@ -18,77 +49,256 @@ def load_geocoded_dict():
     if not os.path.isfile(GEOCODED_JSON_PATH):
         return {}
     try:
-        with open(GEOCODED_JSON_PATH, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, OSError):
+        with open(GEOCODED_JSON_PATH, "rb") as f:
+            return orjson.loads(f.read())
+    except (orjson.JSONDecodeError, OSError):
         return {}
 
 
-@lru_cache(maxsize=1)
+def save_geocoded_arrays(geocoded: dict):
+    """
+    Persist City_State -> [lat, lon] as parallel keys/lats/lons arrays.
+    Much faster to load than the JSON file; written next to it by
+    prewarm_geocoding.
+    Written to a temp file and renamed into place, so a server reloading
+    on mtime change never reads a half-written file.
+    """
+    data_dir = os.path.dirname(GEOCODED_NPZ_PATH)
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                keys=np.array(list(geocoded.keys()), dtype=str),
+                lats=np.fromiter((v[0] for v in geocoded.values()), float, len(geocoded)),
+                lons=np.fromiter((v[1] for v in geocoded.values()), float, len(geocoded)),
+            )
+        os.replace(tmp_path, GEOCODED_NPZ_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_geocoded_arrays():
+    """
+    Load persisted (keys, lats, lons) arrays from disk.
+    Returns None if the file is missing, unreadable or older than the
+    JSON file, so callers fall back to load_geocoded_dict().
+    """
+    npz_mtime = _mtime(GEOCODED_NPZ_PATH)
+    json_mtime = _mtime(GEOCODED_JSON_PATH)
+    if npz_mtime is None or (json_mtime is not None and json_mtime > npz_mtime):
+        return None
+    try:
+        with np.load(GEOCODED_NPZ_PATH) as data:
+            return data['keys'], data['lats'], data['lons']
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+def get_fuel_df_with_coords(fuel_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add lat/lon to fuel dataframe from persisted file or state centroids.
+    No external API calls — keeps API response fast.
+    """
+    arrays = load_geocoded_arrays()
+    if arrays is not None:
+        geo_keys, geo_lats, geo_lons = arrays
+        geocoded = pd.DataFrame({'lat': geo_lats, 'lon': geo_lons}, index=geo_keys)
+    else:
+        geocoded = pd.DataFrame.from_dict(
+            load_geocoded_dict(), orient='index', dtype=float, columns=['lat', 'lon']
+        )
+    keys = fuel_df['City'].str.cat(fuel_df['State'], sep='_')
+
+    # Geocoded coords where we have them (NaN otherwise)
+    found = geocoded.reindex(keys)
+    hit = found['lat'].notna().to_numpy()
+
+    # Fallback: state centroid, or the US centroid for unknown states
+    centroids = pd.DataFrame.from_dict(
+        STATE_CENTROIDS, orient='index', columns=['lat', 'lon']
+    ).reindex(fuel_df['State'])
+    fallback_lat = centroids['lat'].fillna(DEFAULT_CENTROID[0]).to_numpy()
+    fallback_lon = centroids['lon'].fillna(DEFAULT_CENTROID[1]).to_numpy()
+
+    out = fuel_df.copy()
+    out["lat"] = np.where(hit, found['lat'].to_numpy(), fallback_lat)
+    out["lon"] = np.where(hit, found['lon'].to_numpy(), fallback_lon)
+    return out
+
+
+def _unit_xyz(lat_rad, lon_rad):
+    """Map radian lat/lon (scalars or arrays) to xyz on the unit sphere."""
+    cos_lat = np.cos(lat_rad)
+    return np.stack(
+        [cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)],
+        axis=-1,
+    )
+
+
+def _mtime(path):
+    """File modification time, or None if the file is missing."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _data_mtimes():
+    return (_mtime(FUEL_CSV_PATH), _mtime(GEOCODED_JSON_PATH), _mtime(GEOCODED_NPZ_PATH))
+
+
+def fuel_data_version() -> str:
+    """
+    Token that changes whenever the fuel data files change.
+    Include it in cache keys for anything derived from fuel prices.
+    """
+    return repr(_data_mtimes())
+
+
 def load_fuel_data():
     """
-    Load and preprocess fuel data once at startup.
+    Load and preprocess fuel data, cached in memory.
+    The cache is keyed on the data files' mtimes, so replacing
+    fuel_prices.csv or re-running prewarm_geocoding is picked up
+    without a restart.
+    """
+    return _load_fuel_stops().df
+
+
+def _load_fuel_stops() -> _FuelStops:
+    with _LOAD_LOCK:
+        return _load_fuel_stops_cached(*_data_mtimes())
+
+
+@lru_cache(maxsize=1)
+def _load_fuel_stops_cached(csv_mtime, json_mtime, npz_mtime) -> _FuelStops:
+    """
+    Load and preprocess fuel data.
     For duplicate OPIS IDs, keep the cheapest price.
+    Also attaches lat/lon and precomputes the per-stop arrays used by
+    find_nearest_cheap_stops_batch, so requests never touch pandas.
     """
-    csv_path = os.path.join(settings.BASE_DIR, 'data', 'fuel_prices.csv')
-    
-    df = pd.read_csv(csv_path)
+    df = pd.read_csv(FUEL_CSV_PATH)
     
     # Clean up whitespace in city names
     df['City'] = df['City'].str.strip()
     df['Truckstop Name'] = df['Truckstop Name'].str.strip()
     
+    # Rows without a price can't be ranked (and make idxmin raise when a
+    # whole OPIS ID group is blank), so drop them first
+    df = df.dropna(subset=['Retail Price'])
+    
     # For duplicate locations (same OPIS ID), keep cheapest price
-    df = df.sort_values('Retail Price').drop_duplicates(
-        subset=['OPIS Truckstop ID'], 
-        keep='first'
-    )
+    df = df.loc[df.groupby('OPIS Truckstop ID', sort=False)['Retail Price'].idxmin()]
     
-    df = df.reset_index(drop=True)
+    # Stop arrays are indexed in ascending price order, which lets the
+    # nearest_cheap kernel stop scanning early
+    df = df.sort_values('Retail Price', kind='stable').reset_index(drop=True)
+    df = get_fuel_df_with_coords(df)
+
+    lat_rad = np.radians(df['lat'].to_numpy(dtype=np.float64))
+    lon_rad = np.radians(df['lon'].to_numpy(dtype=np.float64))
+
+    # float32 is far more precision than mile-level distances need, and
+    # halves the bytes the per-request kernel streams through
+    stops = _FuelStops(
+        df=df,
+        tree=cKDTree(_unit_xyz(lat_rad, lon_rad)),
+        lat_rad=lat_rad.astype(np.float32),
+        lon_rad=lon_rad.astype(np.float32),
+        cos_lat=np.cos(lat_rad).astype(np.float32),
+        price=df['Retail Price'].to_numpy(dtype=np.float32),
+        rows=tuple(df.to_dict('records')),
+    )
+    for arr in (stops.lat_rad, stops.lon_rad, stops.cos_lat, stops.price):
+        arr.flags.writeable = False
+    warm_up(stops.lat_rad, stops.lon_rad, stops.cos_lat, stops.price)
     
-    return df
+    return stops
 
 
-def find_nearest_cheap_stops(
-    point_lat: float,
-    point_lon: float,
-    fuel_df: pd.DataFrame,
+def find_nearest_cheap_stops_batch(
+    point_lats,
+    point_lons,
     radius_miles: float = 50,
     top_n: int = 5
 ) -> list:
     """
-    Find cheapest fuel stops within radius_miles of a given point.
-    Uses vectorized haversine for speed.
+    Find cheapest fuel stops within radius_miles of each given point.
+    One KD-tree query covers every point; the distance check and top_n
+    selection run in the nearest_cheap kernel.
     
-    Returns list of dicts with stop info.
+    Returns one list of stop dicts (plus 'distance_from_point') per point,
+    sorted by price, then distance.
     """
-    # Haversine vectorized
-    lat1 = np.radians(point_lat)
-    lon1 = np.radians(point_lon)
-    lat2 = np.radians(fuel_df['lat'].values)
-    lon2 = np.radians(fuel_df['lon'].values)
-    
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    
-    EARTH_RADIUS_MILES = 3958.8
-    distances = EARTH_RADIUS_MILES * c
-    
-    fuel_df = fuel_df.copy()
-    fuel_df['distance_from_point'] = distances
-    
-    # Filter within radius
-    nearby = fuel_df[fuel_df['distance_from_point'] <= radius_miles]
-    
-    if nearby.empty:
+    stops = _load_fuel_stops()
+
+    lat1 = np.radians(np.asarray(point_lats, dtype=np.float64))
+    lon1 = np.radians(np.asarray(point_lons, dtype=np.float64))
+    n_points = len(lat1)
+    if n_points == 0:
         return []
-    
-    # Sort by price (cheapest first), then distance
-    nearby = nearby.sort_values(['Retail Price', 'distance_from_point'])
-    
-    top_stops = nearby.head(top_n)
-    
-    return top_stops.to_dict('records')
\ No newline at end of file
+
+    # Great-circle radius -> straight-line chord on the unit sphere, so the
+    # tree returns exactly the stops within radius_miles (plus float fuzz).
+    chord = 2 * math.sin(radius_miles / (2 * EARTH_RADIUS_MILES))
+    hits = stops.tree.query_ball_point(
+        _unit_xyz(lat1, lon1), r=chord * (1 + 1e-9), return_sorted=True
+    )
+
+    # Candidates as one flat array, point w owning cand[offsets[w]:offsets[w + 1]]
+    counts = np.fromiter((len(h) for h in hits), dtype=np.intp, count=n_points)
+    offsets = np.zeros(n_points + 1, dtype=np.intp)
+    np.cumsum(counts, out=offsets[1:])
+    cand = np.fromiter(
+        (i for h in hits for i in h), dtype=np.intp, count=int(offsets[-1])
+    )
+
+    # Precise haversine + radius filter + top_n by (price, distance),
+    # kept in float32 to match the stop arrays
+    stop_idx, distances = nearest_cheap(
+        lat1.astype(np.float32), lon1.astype(np.float32), offsets, cand,
+        stops.lat_rad, stops.lon_rad, stops.cos_lat, stops.price,
+        radius_miles, top_n,
+    )
+
+    return [
+        [
+            {**stops.rows[i], 'distance_from_point': float(d)}
+            for i, d in zip(stop_idx[w], distances[w])
+            if i >= 0
+        ]
+        for w in range(n_points)
+    ]
+
+
+# US State centroids fallback
+STATE_CENTROIDS = {
+    'AL': (32.806671, -86.791130), 'AK': (61.370716, -152.404419),
+    'AZ': (33.729759, -111.431221), 'AR': (34.969704, -92.373123),
+    'CA': (36.116203, -119.681564), 'CO': (39.059811, -105.311104),
+    'CT': (41.597782, -72.755371), 'DE': (39.318523, -75.507141),
+    'FL': (27.766279, -81.686783), 'GA': (33.040619, -83.643074),
+    'HI': (21.094318, -157.498337), 'ID': (44.240459, -114.478828),
+    'IL': (40.349457, -88.986137), 'IN': (39.849426, -86.258278),
+    'IA': (42.011539, -93.210526), 'KS': (38.526600, -96.726486),
+    'KY': (37.668140, -84.670067), 'LA': (31.169960, -91.867805),
+    'ME': (44.693947, -69.381927), 'MD': (39.063946, -76.802101),
+    'MA': (42.230171, -71.530106), 'MI': (43.326618, -84.536095),
+    'MN': (45.694454, -93.900192), 'MS': (32.741646, -89.678696),
+    'MO': (38.456085, -92.288368), 'MT': (46.921925, -110.454353),
+    'NE': (41.125370, -98.268082), 'NV': (38.313515, -117.055374),
+    'NH': (43.452492, -71.563896), 'NJ': (40.298904, -74.521011),
+    'NM': (34.840515, -106.248482), 'NY': (42.165726, -74.948051),
+    'NC': (35.630066, -79.806419), 'ND': (47.528912, -99.784012),
+    'OH': (40.388783, -82.764915), 'OK': (35.565342, -96.928917),
+    'OR': (44.572021, -122.070938), 'PA': (40.590752, -77.209755),
+    'RI': (41.680893, -71.511780), 'SC': (33.856892, -80.945007),
+    'SD': (44.299782, -99.438828), 'TN': (35.747845, -86.692345),
+    'TX': (31.054487, -97.563461), 'UT': (40.150032, -111.862434),
+    'VT': (44.045876, -72.710686), 'VA': (37.769337, -78.169968),
+    'WA': (47.400902, -121.490494), 'WV': (38.491226, -80.954453),
+    'WI': (44.268543, -89.616508), 'WY': (42.755966, -107.302490),
+}
\ No newline at end of file
@@ -6,7 +6,8 @@ from route_planner.optimizer import geocode_fuel_data
 class Command(BaseCommand):
     help = (
         "Pre-geocode all unique fuel stop locations (City+State) via Nominatim "
-        "and save to data/fuel_geocoded.json. The API then uses this file so it "
+        "and save to data/fuel_geocoded.json (plus a fast-loading "
+        "data/fuel_geocoded.npz copy). The API then uses these files so it "
         "never calls Nominatim on user requests. Run once (or after adding new "
         "fuel data). Respects Nominatim's 1 req/s limit, so expect ~1 second "
         "per new location (e.g. 15–40 min for a full first run)."
@@ -24,6 +25,7 @@ class Command(BaseCommand):
         geocode_fuel_data(fuel_df)
         self.stdout.write(
             self.style.SUCCESS(
-                "Done! All fuel stops geocoded and saved to data/fuel_geocoded.json"
+                "Done! All fuel stops geocoded and saved to data/fuel_geocoded.json "
+                "and data/fuel_geocoded.npz"
             )
         )
\ No newline at end of file
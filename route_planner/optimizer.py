@@ -7,12 +7,18 @@ from typing import List
 import numpy as np
 import pandas as pd
 import requests
+from django.core.cache import cache
 
 from .fuel_service import (
-    find_nearest_cheap_stops,
-    load_fuel_data,
+    find_nearest_cheap_stops_batch,
+    fuel_data_version,
+    get_fuel_df_with_coords,
+    load_geocoded_arrays,
     load_geocoded_dict,
+    save_geocoded_arrays,
+    DEFAULT_CENTROID,
     GEOCODED_JSON_PATH,
+    STATE_CENTROIDS,
 )
 
 
@@ -20,81 +26,74 @@ MAX_RANGE_MILES = 500
 MPG = 10
 # We want to refuel at ~400 miles to stay safe (80% of max range)
 REFUEL_INTERVAL_MILES = 400
-DEFAULT_CENTROID = (39.5, -98.35)
+
+# Reused across Nominatim requests to keep the connection alive
+_NOMINATIM_SESSION = requests.Session()
+_NOMINATIM_SESSION.headers.update({"User-Agent": "FuelRouteOptimizer/1.0"})
 
 
 def make_cache_key(prefix: str, value: str) -> str:
     """
     Create a safe cache key by hashing the value.
     Avoids issues with spaces, special chars, etc.
+    BLAKE2b (16-byte digest) is cheaper than MD5 for short inputs and
+    keeps keys a fixed length.
     """
-    hashed = hashlib.md5(value.encode("utf-8")).hexdigest()
+    hashed = hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
     return f"{prefix}_{hashed}"
 
 
-def haversine_miles(lat1, lon1, lat2, lon2):
-    """Single point haversine distance in miles."""
+def haversine_miles_vec(lat1, lon1, lat2_arr, lon2_arr):
+    """Vectorized haversine distance in miles; inputs broadcast like NumPy."""
     R = 3958.8
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2_arr, lon2_arr])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
     return R * 2 * np.arcsin(np.sqrt(a))
 
 
-def get_point_at_distance(coords: list, target_miles: float) -> tuple:
+def _precompute_cumulative_miles(coords: np.ndarray) -> np.ndarray:
     """
-    Walk along route coordinates until we've traveled target_miles.
-    Returns (lat, lon) at that point along the route.
+    Cumulative distance in miles at each route coordinate (cum[0] == 0).
+    One vectorized haversine over all adjacent pairs.
     """
-    accumulated = 0.0
-    
-    for i in range(1, len(coords)):
-        lat1, lon1 = coords[i-1]
-        lat2, lon2 = coords[i]
-        
-        segment_dist = haversine_miles(lat1, lon1, lat2, lon2)
-        
-        if accumulated + segment_dist >= target_miles:
-            # Interpolate within this segment
-            remaining = target_miles - accumulated
-            fraction = remaining / segment_dist if segment_dist > 0 else 0
-            
-            interp_lat = lat1 + fraction * (lat2 - lat1)
-            interp_lon = lon1 + fraction * (lon2 - lon1)
-            
-            return (interp_lat, interp_lon)
-        
-        accumulated += segment_dist
-    
-    # If target exceeds route, return last point
-    return coords[-1]
+    seg_dist = haversine_miles_vec(
+        coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]
+    )
+    cum = np.empty(len(coords))
+    cum[0] = 0.0
+    np.cumsum(seg_dist, out=cum[1:])
+    return cum
 
 
-def get_fuel_df_with_coords(fuel_df: pd.DataFrame) -> pd.DataFrame:
+def get_point_at_distance(
+    cum: np.ndarray,
+    coords: np.ndarray,
+    target_miles: float
+) -> tuple:
     """
-    Add lat/lon to fuel dataframe from persisted file or state centroids.
-    No external API calls — keeps API response fast.
+    Find the point target_miles along the route.
+    cum comes from _precompute_cumulative_miles(coords).
+    Returns (lat, lon) at that point along the route.
     """
-    geocoded = load_geocoded_dict()
-    lats: List[float] = []
-    lons: List[float] = []
-
-    for _, row in fuel_df.iterrows():
-        city_state = f"{row['City']}_{row['State']}"
-        coords = geocoded.get(city_state)
-        if coords is not None:
-            lats.append(coords[0])
-            lons.append(coords[1])
-        else:
-            lat, lon = STATE_CENTROIDS.get(row["State"], DEFAULT_CENTROID)
-            lats.append(lat)
-            lons.append(lon)
-
-    out = fuel_df.copy()
-    out["lat"] = lats
-    out["lon"] = lons
-    return out
+    # First coordinate at or past the target; the segment ends there
+    i = max(int(np.searchsorted(cum, target_miles)), 1)
+    
+    # If target exceeds route, return last point
+    if i >= len(cum):
+        return (float(coords[-1, 0]), float(coords[-1, 1]))
+    
+    # Interpolate within this segment
+    segment_dist = cum[i] - cum[i-1]
+    fraction = (target_miles - cum[i-1]) / segment_dist if segment_dist > 0 else 0
+    
+    lat1, lon1 = coords[i-1]
+    lat2, lon2 = coords[i]
+    interp_lat = lat1 + fraction * (lat2 - lat1)
+    interp_lon = lon1 + fraction * (lon2 - lon1)
+    
+    return (float(interp_lat), float(interp_lon))
 
 
 def geocode_fuel_data(fuel_df: pd.DataFrame) -> pd.DataFrame:
@@ -119,7 +118,6 @@ def geocode_fuel_data(fuel_df: pd.DataFrame) -> pd.DataFrame:
             unique_missing.append(k)
 
     if unique_missing:
-        headers = {"User-Agent": "FuelRouteOptimizer/1.0"}
         for city_state in unique_missing:
             city, state = city_state.rsplit("_", 1)
             query = f"{city}, {state}, USA"
@@ -131,7 +129,7 @@ def geocode_fuel_data(fuel_df: pd.DataFrame) -> pd.DataFrame:
                 "countrycodes": "us",
             }
             try:
-                resp = requests.get(url, params=params, headers=headers, timeout=5)
+                resp = _NOMINATIM_SESSION.get(url, params=params, timeout=5)
                 data = resp.json()
                 if data:
                     lat = float(data[0]["lat"])
@@ -149,6 +147,9 @@ def geocode_fuel_data(fuel_df: pd.DataFrame) -> pd.DataFrame:
         with open(GEOCODED_JSON_PATH, "w") as f:
             json.dump(geocoded, f, indent=0)
 
+    if unique_missing or load_geocoded_arrays() is None:
+        save_geocoded_arrays(geocoded)
+
     return get_fuel_df_with_coords(fuel_df)
 
 
@@ -166,8 +167,17 @@ def optimize_fuel_stops(
     3. Calculate total fuel cost
     
     Returns fuel stops and cost summary.
+    Results are cached per (route, distance, fuel data version).
     """
-    fuel_df_geo = get_fuel_df_with_coords(fuel_df)
+    coords = np.asarray(route_coords, dtype=np.float64)
+    
+    route_hash = hashlib.blake2b(coords.tobytes(), digest_size=16)
+    route_hash.update(np.float64(total_distance_miles).tobytes())
+    route_hash.update(fuel_data_version().encode("utf-8"))
+    cache_key = f"fuel_opt_{route_hash.hexdigest()}"
+    cached = cache.get(cache_key)
+    if cached:
+        return cached
     
     fuel_stops = []
     current_miles = 0
@@ -188,96 +198,116 @@ def optimize_fuel_stops(
             waypoints_to_check.append(miles)
             miles += REFUEL_INTERVAL_MILES
     
-    for waypoint_miles in waypoints_to_check:
-        # Get the lat/lon at this distance along route
-        point = get_point_at_distance(route_coords, waypoint_miles)
-        
-        # Find cheapest nearby stops
-        nearby_stops = find_nearest_cheap_stops(
-            point_lat=point[0],
-            point_lon=point[1],
-            fuel_df=fuel_df_geo,
-            radius_miles=75,  # Search wider radius for better prices
+    cum_miles = _precompute_cumulative_miles(coords)
+    
+    # Get the lat/lon at each waypoint distance along route
+    points = [
+        get_point_at_distance(cum_miles, coords, waypoint_miles)
+        for waypoint_miles in waypoints_to_check
+    ]
+    point_lats = [p[0] for p in points]
+    point_lons = [p[1] for p in points]
+    
+    # Find cheapest nearby stops for all waypoints in one pass
+    nearby_by_waypoint = find_nearest_cheap_stops_batch(
+        point_lats,
+        point_lons,
+        radius_miles=75,  # Search wider radius for better prices
+        top_n=3
+    )
+    
+    # Expand search radius where nothing was found
+    missing = [i for i, stops in enumerate(nearby_by_waypoint) if not stops]
+    if missing:
+        wider = find_nearest_cheap_stops_batch(
+            [point_lats[i] for i in missing],
+            [point_lons[i] for i in missing],
+            radius_miles=150,
             top_n=3
         )
+        for i, stops in zip(missing, wider):
+            nearby_by_waypoint[i] = stops
+    
+    found = [
+        (waypoint_miles, nearby_stops)
+        for waypoint_miles, nearby_stops in zip(waypoints_to_check, nearby_by_waypoint)
+        if nearby_stops
+    ]
+    
+    # Round with round() on Python floats, not np.round: np.round scales
+    # by 10**decimals first, which turns e.g. 3.3365 (stored just above
+    # the tie) into 3.336 instead of 3.337.
+    stop_miles = [round(m, 1) for m, _ in found]
+    prices = [
+        round(float(s['Retail Price']), 3)
+        for _, nearby_stops in found
+        for s in nearby_stops
+    ]
+    
+    pos = 0
+    for (_, nearby_stops), miles in zip(found, stop_miles):
+        stop_prices = prices[pos:pos + len(nearby_stops)]
+        pos += len(nearby_stops)
         
-        if not nearby_stops:
-            # Expand search radius
-            nearby_stops = find_nearest_cheap_stops(
-                point_lat=point[0],
-                point_lon=point[1],
-                fuel_df=fuel_df_geo,
-                radius_miles=150,
-                top_n=3
-            )
-        
-        if nearby_stops:
-            best_stop = nearby_stops[0]  # Already sorted by price
-            fuel_stops.append({
-                'opis_id': best_stop['OPIS Truckstop ID'],
-                'name': best_stop['Truckstop Name'],
-                'address': best_stop['Address'],
-                'city': best_stop['City'],
-                'state': best_stop['State'],
-                'lat': best_stop['lat'],
-                'lon': best_stop['lon'],
-                'retail_price_per_gallon': round(best_stop['Retail Price'], 3),
-                'miles_from_start': round(waypoint_miles, 1),
-                'alternatives': [
-                    {
-                        'name': s['Truckstop Name'],
-                        'city': s['City'],
-                        'state': s['State'],
-                        'price': round(s['Retail Price'], 3),
-                        'lat': s['lat'],
-                        'lon': s['lon'],
-                    }
-                    for s in nearby_stops[1:]
-                ]
-            })
+        best_stop = nearby_stops[0]  # Already sorted by price
+        fuel_stops.append({
+            'opis_id': best_stop['OPIS Truckstop ID'],
+            'name': best_stop['Truckstop Name'],
+            'address': best_stop['Address'],
+            'city': best_stop['City'],
+            'state': best_stop['State'],
+            'lat': best_stop['lat'],
+            'lon': best_stop['lon'],
+            'retail_price_per_gallon': stop_prices[0],
+            'miles_from_start': miles,
+            'alternatives': [
+                {
+                    'name': s['Truckstop Name'],
+                    'city': s['City'],
+                    'state': s['State'],
+                    'price': price,
+                    'lat': s['lat'],
+                    'lon': s['lon'],
+                }
+                for s, price in zip(nearby_stops[1:], stop_prices[1:])
+            ]
+        })
     
     # Calculate total fuel cost
     total_gallons = total_distance_miles / MPG
     
     if fuel_stops:
-        avg_price = np.mean([s['retail_price_per_gallon'] for s in fuel_stops])
+        best_prices = np.array([s['retail_price_per_gallon'] for s in fuel_stops])
+        avg_price = best_prices.mean()
     else:
         # No stops found, use average from dataset
-        avg_price = fuel_df_geo['Retail Price'].mean()
+        avg_price = fuel_df['Retail Price'].mean()
     
     total_cost = total_gallons * avg_price
     
-    # Per-segment cost calculation
+    # Per-segment cost calculation: start -> each stop -> destination.
+    # Each leg is priced at the stop it ends at; the final leg at the last stop.
     segments = []
-    prev_miles = 0
     
-    for stop in fuel_stops:
-        segment_miles = stop['miles_from_start'] - prev_miles
-        gallons = segment_miles / MPG
-        cost = gallons * stop['retail_price_per_gallon']
-        segments.append({
-            'from_miles': prev_miles,
-            'to_miles': stop['miles_from_start'],
-            'segment_miles': round(segment_miles, 1),
-            'gallons_needed': round(gallons, 2),
-            'cost_usd': round(cost, 2)
-        })
-        prev_miles = stop['miles_from_start']
-    
-    # Last segment (final stop to destination)
     if fuel_stops:
-        last_segment_miles = total_distance_miles - prev_miles
-        last_gallons = last_segment_miles / MPG
-        last_cost = last_gallons * fuel_stops[-1]['retail_price_per_gallon']
-        segments.append({
-            'from_miles': prev_miles,
-            'to_miles': round(total_distance_miles, 1),
-            'segment_miles': round(last_segment_miles, 1),
-            'gallons_needed': round(last_gallons, 2),
-            'cost_usd': round(last_cost, 2)
-        })
+        from_miles = [0] + stop_miles
+        to_miles = stop_miles + [round(total_distance_miles, 1)]
+        # The last leg runs to the unrounded total, as do its gallons and cost
+        leg_ends = stop_miles + [total_distance_miles]
+        leg_prices = best_prices.tolist() + [best_prices[-1].item()]
+        
+        segments = [
+            {
+                'from_miles': f,
+                'to_miles': t,
+                'segment_miles': round(end - f, 1),
+                'gallons_needed': round((end - f) / MPG, 2),
+                'cost_usd': round((end - f) / MPG * price, 2)
+            }
+            for f, t, end, price in zip(from_miles, to_miles, leg_ends, leg_prices)
+        ]
     
-    return {
+    result = {
         'fuel_stops': fuel_stops,
         'total_gallons': round(total_gallons, 2),
         'total_distance_miles': round(total_distance_miles, 1),
@@ -287,33 +317,8 @@ def optimize_fuel_stops(
         'vehicle_range_miles': MAX_RANGE_MILES,
         'mpg': MPG
     }
-
-
-# US State centroids fallback
-STATE_CENTROIDS = {
-    'AL': (32.806671, -86.791130), 'AK': (61.370716, -152.404419),
-    'AZ': (33.729759, -111.431221), 'AR': (34.969704, -92.373123),
-    'CA': (36.116203, -119.681564), 'CO': (39.059811, -105.311104),
-    'CT': (41.597782, -72.755371), 'DE': (39.318523, -75.507141),
-    'FL': (27.766279, -81.686783), 'GA': (33.040619, -83.643074),
-    'HI': (21.094318, -157.498337), 'ID': (44.240459, -114.478828),
-    'IL': (40.349457, -88.986137), 'IN': (39.849426, -86.258278),
-    'IA': (42.011539, -93.210526), 'KS': (38.526600, -96.726486),
-    'KY': (37.668140, -84.670067), 'LA': (31.169960, -91.867805),
-    'ME': (44.693947, -69.381927), 'MD': (39.063946, -76.802101),
-    'MA': (42.230171, -71.530106), 'MI': (43.326618, -84.536095),
-    'MN': (45.694454, -93.900192), 'MS': (32.741646, -89.678696),
-    'MO': (38.456085, -92.288368), 'MT': (46.921925, -110.454353),
-    'NE': (41.125370, -98.268082), 'NV': (38.313515, -117.055374),
-    'NH': (43.452492, -71.563896), 'NJ': (40.298904, -74.521011),
-    'NM': (34.840515, -106.248482), 'NY': (42.165726, -74.948051),
-    'NC': (35.630066, -79.806419), 'ND': (47.528912, -99.784012),
-    'OH': (40.388783, -82.764915), 'OK': (35.565342, -96.928917),
-    'OR': (44.572021, -122.070938), 'PA': (40.590752, -77.209755),
-    'RI': (41.680893, -71.511780), 'SC': (33.856892, -80.945007),
-    'SD': (44.299782, -99.438828), 'TN': (35.747845, -86.692345),
-    'TX': (31.054487, -97.563461), 'UT': (40.150032, -111.862434),
-    'VT': (44.045876, -72.710686), 'VA': (37.769337, -78.169968),
-    'WA': (47.400902, -121.490494), 'WV': (38.491226, -80.954453),
-    'WI': (44.268543, -89.616508), 'WY': (42.755966, -107.302490),
-}
\ No newline at end of file
+    
+    # Cache for 1 hour, same as the route it is derived from
+    cache.set(cache_key, result, 60 * 60)
+    
+    return result
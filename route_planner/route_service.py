@@ -1,3 +1,5 @@
+import numpy as np
+import orjson
 import requests
 from django.conf import settings
 from django.core.cache import cache
@@ -5,6 +7,11 @@ from django.core.cache import cache
 from .optimizer import make_cache_key
 
 
+# One session per process so ORS calls reuse pooled keep-alive connections
+# instead of a fresh TCP + TLS handshake each time (gzip is on by default)
+_SESSION = requests.Session()
+
+
 def _handle_ors_error(e, context: str) -> str:
     """Turn ORS/requests errors into a clear message for the API response."""
     if isinstance(e, requests.HTTPError) and e.response is not None:
@@ -24,15 +31,43 @@ def _handle_ors_error(e, context: str) -> str:
     return f"{context}: {e!s}"
 
 
+def encode_polyline(coords, precision: int = 5) -> str:
+    """
+    Encode (lat, lon) coords to Google polyline format, vectorized with NumPy.
+    Output matches the reference algorithm (Python 2 style rounding).
+    """
+    scaled = np.asarray(coords, dtype=np.float64).reshape(-1, 2) * 10 ** precision
+    ints = (np.sign(scaled) * np.floor(np.abs(scaled) + 0.5)).astype(np.int64)
+
+    # Zig-zag encode the deltas, lat/lon interleaved
+    deltas = np.diff(ints, axis=0, prepend=0).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Split each value into 5-bit chunks, low bits first; every chunk but the
+    # last gets the 0x20 continuation bit
+    shifts = np.arange(0, 35, 5)
+    chunks = (values[:, None] >> shifts) & 0x1F
+    n_chunks = 1 + ((values[:, None] >> shifts[1:]) > 0).sum(axis=1)
+    used = shifts // 5 < n_chunks[:, None]
+    more = shifts // 5 < (n_chunks - 1)[:, None]
+    chars = (chunks | np.where(more, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def cached_geocode(location: str):
+    """Return the cached (lat, lon) for a location, or None on a cache miss."""
+    return cache.get(make_cache_key("geocode", location))
+
+
 def geocode_location(location: str) -> tuple:
     """
     Geocode a location string to (lat, lon) using ORS geocoding.
     Free, no extra API needed.
     """
-    cache_key = make_cache_key("geocode", location)
-    cached = cache.get(cache_key)
+    cached = cached_geocode(location)
     if cached:
         return cached
+    cache_key = make_cache_key("geocode", location)
     
     url = "https://api.openrouteservice.org/geocode/search"
     params = {
@@ -43,12 +78,12 @@ def geocode_location(location: str) -> tuple:
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = _SESSION.get(url, params=params, timeout=10)
         response.raise_for_status()
     except Exception as e:
         raise RuntimeError(_handle_ors_error(e, "geocoding failed"))
     
-    data = response.json()
+    data = orjson.loads(response.content)
     
     if not data.get('features'):
         raise ValueError(f"Could not geocode location: {location}")
@@ -68,7 +103,8 @@ def get_route(start_coords: tuple, end_coords: tuple) -> dict:
     Returns:
         - total_distance_miles
         - duration_seconds  
-        - polyline_coords: list of (lat, lon) tuples
+        - polyline_coords: (N, 2) float ndarray of (lat, lon)
+        - polyline: polyline_coords encoded in Google polyline format
         - bbox
     """
     cache_key = make_cache_key("route", f"{start_coords}{end_coords}")
@@ -93,12 +129,12 @@ def get_route(start_coords: tuple, end_coords: tuple) -> dict:
     }
     
     try:
-        response = requests.post(url, json=body, headers=headers, timeout=30)
+        response = _SESSION.post(url, json=body, headers=headers, timeout=30)
         response.raise_for_status()
     except Exception as e:
         raise RuntimeError(_handle_ors_error(e, "routing failed"))
 
-    data = response.json()
+    data = orjson.loads(response.content)
 
     # ORS can return 200 with an error body (e.g. no route found, invalid params)
     if not data.get("features"):
@@ -121,12 +157,15 @@ def get_route(start_coords: tuple, end_coords: tuple) -> dict:
     raw_coords = feature.get("geometry", {}).get("coordinates")
     if not raw_coords:
         raise RuntimeError("Routing failed: no geometry in route response.")
-    coords_latlon = [(c[1], c[0]) for c in raw_coords]
+    # GeoJSON is [lon, lat]; swap columns in one go
+    coords_latlon = np.asarray(raw_coords, dtype=np.float64)[:, [1, 0]]
 
     result = {
         "total_distance_miles": props["distance"],
         "duration_seconds": props["duration"],
         "polyline_coords": coords_latlon,
+        # Encoded once here so it is cached with the route
+        "polyline": encode_polyline(coords_latlon),
         "bbox": feature.get("bbox"),
     }
 
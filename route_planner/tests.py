@@ -1,3 +1,257 @@
-from django.test import TestCase
+import os
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from . import _kernels, fuel_service, views
+from .optimizer import (
+    _precompute_cumulative_miles,
+    get_point_at_distance,
+    make_cache_key,
+    optimize_fuel_stops,
+)
+from .route_service import encode_polyline
+
+
+class EncodePolylineTests(SimpleTestCase):
+    """Known encodings, produced by the reference polyline package."""
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([]), "")
+
+    def test_single_point(self):
+        self.assertEqual(encode_polyline([(38.5, -120.2)]), "_p~iF~ps|U")
+
+    def test_google_example(self):
+        coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(coords), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_negative_and_half_rounding(self):
+        coords = [(-33.86882, 151.20929), (-33.8687, 151.2093), (0.000005, -0.000005)]
+        self.assertEqual(encode_polyline(coords), "b_vmEaa|y[WAm~umEda|y[")
+
+    def test_precision(self):
+        coords = [(38.5, -120.2), (40.7, -120.95)]
+        self.assertEqual(encode_polyline(coords, 6), "_izlhA~rlgdF_{geC~ywl@")
+
+
+@unittest.skipIf(_kernels.njit is None, "numba is not installed")
+class NearestCheapKernelTests(SimpleTestCase):
+    """The numba kernel must pick the same stops, in the same order, as NumPy."""
+
+    def _stops(self, lat_deg, lon_deg, price):
+        order = np.argsort(price, kind="stable")
+        lat = np.radians(np.asarray(lat_deg, dtype=np.float32)[order])
+        lon = np.radians(np.asarray(lon_deg, dtype=np.float32)[order])
+        return (
+            lat.astype(np.float32),
+            lon.astype(np.float32),
+            np.cos(lat).astype(np.float32),
+            np.asarray(price, dtype=np.float32)[order],
+        )
+
+    def _assert_parity(self, lat_w, lon_w, stops, radius, top_n):
+        lat_s, lon_s, cos_s, price = stops
+        # Every stop is a candidate for every waypoint; the radius filter
+        # inside the kernels does the rest
+        n_points, n_stops = len(lat_w), len(lat_s)
+        offsets = np.arange(n_points + 1, dtype=np.intp) * n_stops
+        cand = np.tile(np.arange(n_stops, dtype=np.intp), n_points)
+        args = (lat_w, lon_w, offsets, cand, lat_s, lon_s, cos_s, price, float(radius), top_n)
+
+        jit_idx, jit_dist = _kernels._nearest_cheap_jit(*args)
+        np_idx, np_dist = _kernels._nearest_cheap_numpy(*args)
+        np.testing.assert_array_equal(jit_idx, np_idx)
+        np.testing.assert_allclose(jit_dist, np_dist, rtol=1e-6)
+        return jit_idx
+
+    def test_exact_ties(self):
+        # Stops 0-3 share location and price; 4-5 share price at equal distance
+        stops = self._stops(
+            [35.0, 35.0, 35.0, 35.0, 35.5, 34.5, 35.2],
+            [-100.0, -100.0, -100.0, -100.0, -100.0, -100.0, -100.0],
+            [3.1, 3.1, 3.1, 3.1, 2.9, 2.9, 3.5],
+        )
+        lat_w = np.radians(np.array([35.0, 36.0], dtype=np.float32))
+        lon_w = np.radians(np.array([-100.0, -100.0], dtype=np.float32))
+        idx = self._assert_parity(lat_w, lon_w, stops, radius=75, top_n=5)
+        # Equal price and distance keep the earlier stop first
+        self.assertEqual(list(idx[0]), [0, 1, 2, 3, 4])
+
+    def test_random(self):
+        rng = np.random.default_rng(0)
+        n_stops = 500
+        stops = self._stops(
+            rng.uniform(30, 45, n_stops),
+            rng.uniform(-120, -80, n_stops),
+            np.round(rng.uniform(2.8, 4.5, n_stops), 2),
+        )
+        lat_w = np.radians(rng.uniform(30, 45, 40)).astype(np.float32)
+        lon_w = np.radians(rng.uniform(-120, -80, 40)).astype(np.float32)
+        for radius, top_n in ((75, 5), (150, 5), (300, 1)):
+            self._assert_parity(lat_w, lon_w, stops, radius, top_n)
+
+
+class OptimizeRoundingTests(SimpleTestCase):
+    """Rounded output must match the original scalar round() results."""
+
+    STOP = {
+        'OPIS Truckstop ID': 1, 'Truckstop Name': 'A', 'Address': 'I-40',
+        'City': 'Amarillo', 'State': 'TX', 'Retail Price': 3.3365,
+        'lat': 35.0, 'lon': -100.0, 'distance_from_point': 1.0,
+    }
+
+    def _optimize(self, total_distance_miles):
+        cache.clear()
+        with mock.patch(
+            'route_planner.optimizer.find_nearest_cheap_stops_batch',
+            side_effect=lambda lats, lons, **kwargs: [[dict(self.STOP)] for _ in lats],
+        ):
+            return optimize_fuel_stops(
+                [[35.0, -100.0], [35.0, -80.0]],
+                total_distance_miles,
+                pd.DataFrame({'Retail Price': [3.0]}),
+            )
+
+    def test_total_ending_in_five(self):
+        result = self._optimize(629.15)
+        self.assertEqual(result['fuel_stops'][0]['retail_price_per_gallon'], 3.337)
+        self.assertEqual(result['segments'], [
+            {'from_miles': 0, 'to_miles': 400, 'segment_miles': 400,
+             'gallons_needed': 40.0, 'cost_usd': 133.48},
+            {'from_miles': 400, 'to_miles': 629.1, 'segment_miles': 229.1,
+             'gallons_needed': 22.91, 'cost_usd': 76.47},
+        ])
+        self.assertEqual(result['total_fuel_cost_usd'], 209.95)
+
+    def test_gallons_ending_in_five(self):
+        result = self._optimize(529.25)
+        self.assertEqual(result['segments'][-1]['segment_miles'], 129.2)
+        self.assertEqual(result['segments'][-1]['gallons_needed'], 12.93)
+        self.assertEqual(result['segments'][-1]['cost_usd'], 43.13)
+
+    def test_single_stop_midpoint(self):
+        result = self._optimize(258.25)
+        self.assertEqual(result['fuel_stops'][0]['miles_from_start'], 129.1)
+        self.assertEqual(
+            [s['segment_miles'] for s in result['segments']], [129.1, 129.2]
+        )
+
+
+class LoadFuelStopsTests(SimpleTestCase):
+    CSV = (
+        "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n"
+        "1,A ,I-40,Amarillo ,TX,1,3.50\n"
+        "1,A ,I-40,Amarillo ,TX,1,3.20\n"
+        "1,A ,I-40,Amarillo ,TX,1,\n"
+        "2,B,I-35,Dallas,TX,1,\n"
+        "2,B,I-35,Dallas,TX,1,\n"
+        "3,C,I-10,El Paso,TX,1,3.10\n"
+    )
+
+    def _load(self, csv):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fuel_prices.csv")
+            with open(path, "w") as f:
+                f.write(csv)
+            with mock.patch.object(fuel_service, "FUEL_CSV_PATH", path):
+                # Bypass the lru_cache so the real data stays cached
+                return fuel_service._load_fuel_stops_cached.__wrapped__(0, 0, 0)
+
+    def test_cheapest_per_opis_id_sorted_by_price(self):
+        df = self._load(self.CSV).df
+        self.assertEqual(df['OPIS Truckstop ID'].tolist(), [3, 1])
+        self.assertEqual(df['Retail Price'].tolist(), [3.10, 3.20])
+        self.assertEqual(df['City'].tolist(), ['El Paso', 'Amarillo'])
+
+    def test_all_blank_prices_group_is_dropped(self):
+        stops = self._load(self.CSV)
+        self.assertNotIn(2, stops.df['OPIS Truckstop ID'].tolist())
+        self.assertFalse(np.isnan(stops.price).any())
+
+
+class GeocodePairTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache.set(make_cache_key("geocode", "Chicago, IL"), (41.88, -87.63))
+
+    def test_cached_lookups_skip_the_pool(self):
+        cache.set(make_cache_key("geocode", "Dallas, TX"), (32.78, -96.8))
+        with mock.patch.object(views, "_GEOCODE_EXECUTOR") as executor, \
+                mock.patch.object(views, "geocode_location") as geocode:
+            coords = views.geocode_pair("Chicago, IL", "Dallas, TX")
+        self.assertEqual(coords, ((41.88, -87.63), (32.78, -96.8)))
+        executor.submit.assert_not_called()
+        geocode.assert_not_called()
+
+    def test_one_miss_is_geocoded_inline(self):
+        with mock.patch.object(views, "_GEOCODE_EXECUTOR") as executor, \
+                mock.patch.object(views, "geocode_location", return_value=(32.78, -96.8)) as geocode:
+            coords = views.geocode_pair("Chicago, IL", "Dallas, TX")
+        self.assertEqual(coords, ((41.88, -87.63), (32.78, -96.8)))
+        executor.submit.assert_not_called()
+        geocode.assert_called_once_with("Dallas, TX")
+
+    def test_start_error_wins_when_both_miss(self):
+        def geocode(location):
+            raise ValueError(location)
+
+        with mock.patch.object(views, "geocode_location", side_effect=geocode):
+            with self.assertRaisesMessage(ValueError, "Austin, TX"):
+                views.geocode_pair("Austin, TX", "Dallas, TX")
+
+
+class SampleCoordsTests(SimpleTestCase):
+    def _coords(self, n):
+        return [[30.0 + i * 1e-3, -100.0 - i * 1e-3] for i in range(n)]
+
+    def test_at_most_max_points_and_keeps_both_ends(self):
+        for n in (199, 200, 401, 5000):
+            with self.subTest(n=n):
+                coords = self._coords(n)
+                sampled = views.sample_coords(coords, 200)
+                self.assertLessEqual(len(sampled), 200)
+                self.assertEqual(len(sampled), min(n, 200))
+                self.assertEqual(sampled[0], {'lat': coords[0][0], 'lon': coords[0][1]})
+                self.assertEqual(sampled[-1], {'lat': coords[-1][0], 'lon': coords[-1][1]})
+
+    def test_short_route_is_returned_whole(self):
+        coords = self._coords(199)
+        self.assertEqual(
+            views.sample_coords(coords, 200),
+            [{'lat': lat, 'lon': lon} for lat, lon in coords],
+        )
+
+
+class PointAtDistanceTests(SimpleTestCase):
+    def _point(self, coords, target_miles):
+        coords = np.asarray(coords, dtype=np.float64)
+        return get_point_at_distance(_precompute_cumulative_miles(coords), coords, target_miles)
+
+    def test_interpolates_within_segment(self):
+        coords = [[0.0, 0.0], [0.0, 1.0], [0.0, 2.0]]
+        one_degree = _precompute_cumulative_miles(np.asarray(coords))[1]
+        lat, lon = self._point(coords, one_degree * 1.5)
+        self.assertAlmostEqual(lat, 0.0)
+        self.assertAlmostEqual(lon, 1.5)
+
+    def test_zero_length_segments(self):
+        coords = [[0.0, 0.0], [0.0, 1.0], [0.0, 1.0], [0.0, 1.0], [0.0, 2.0]]
+        one_degree = _precompute_cumulative_miles(np.asarray(coords))[1]
+        self.assertEqual(self._point(coords, 0), (0.0, 0.0))
+        self.assertEqual(self._point(coords, one_degree), (0.0, 1.0))
+        lat, lon = self._point(coords, one_degree * 1.25)
+        self.assertAlmostEqual(lon, 1.25)
+        # A route of one repeated point has no length at all
+        self.assertEqual(self._point([[35.0, -100.0]] * 3, 0), (35.0, -100.0))
+
+    def test_target_past_the_end_returns_last_point(self):
+        coords = [[0.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+        self.assertEqual(self._point(coords, 10_000), (1.0, 1.0))
+        self.assertEqual(self._point([[35.0, -100.0]], 50), (35.0, -100.0))
+        self.assertEqual(self._point([[35.0, -100.0]] * 3, 50), (35.0, -100.0))
@@ -1,15 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from django.conf import settings
 from django.core.cache import cache
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
 from django.shortcuts import render
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 
 from .fuel_service import load_fuel_data
 from .optimizer import make_cache_key, optimize_fuel_stops
-from .route_service import geocode_location, get_route
+from .renderers import ORJSONRenderer
+from .route_service import cached_geocode, geocode_location, get_route
+
+
+# Shared across requests so geocoding doesn't pay thread start-up each time.
+# Each request borrows at most one worker (see geocode_pair) and threads are
+# only started on demand, so a generous cap keeps one slow ORS call from
+# queueing geocodes for unrelated requests.
+_GEOCODE_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="geocode")
 
 
 def home(request):
@@ -49,6 +61,7 @@ class RouteOptimizerView(APIView):
         "end": "Los Angeles, CA"
     }
     """
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
     
     def post(self, request):
         start = request.data.get('start', '').strip()
@@ -81,8 +94,7 @@ class RouteOptimizerView(APIView):
         
         try:
             # Step 1: Geocode start and end (may use cached results)
-            start_coords = geocode_location(start)
-            end_coords = geocode_location(end)
+            start_coords, end_coords = geocode_pair(start, end)
             
         except ValueError as e:
             return Response(
@@ -140,7 +152,7 @@ class RouteOptimizerView(APIView):
                     route_data['duration_seconds'] / 3600, 2
                 ),
                 # Polyline for map rendering (encoded for smaller payload)
-                'polyline': encode_polyline(route_data['polyline_coords']),
+                'polyline': route_data['polyline'],
                 # Raw coords for easy frontend map rendering
                 'waypoints': sample_coords(route_data['polyline_coords'], 200),
             },
@@ -165,18 +177,39 @@ class RouteOptimizerView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-def encode_polyline(coords: list) -> str:
-    """Encode coords to Google polyline format for compact transmission."""
-    import polyline as pl
-    return pl.encode(coords)
+def geocode_pair(start: str, end: str) -> tuple:
+    """
+    Geocode start and end, overlapping the two ORS calls when both miss
+    the cache. The end lookup runs on the calling thread, so only one
+    pool hand-off is paid, and none at all when either side is cached.
+    """
+    start_coords = cached_geocode(start)
+    end_coords = cached_geocode(end)
+    if start_coords and end_coords:
+        return start_coords, end_coords
+    if start_coords or end_coords:
+        return (
+            start_coords or geocode_location(start),
+            end_coords or geocode_location(end),
+        )
+
+    start_future = _GEOCODE_EXECUTOR.submit(geocode_location, start)
+    try:
+        end_coords = geocode_location(end)
+    finally:
+        # Wait for the start lookup even if the end one failed
+        start_coords = start_future.result()
+    return start_coords, end_coords
 
 
-def sample_coords(coords: list, max_points: int = 200) -> list:
-    """Sample route coordinates to reduce payload size."""
-    if len(coords) <= max_points:
-        return [{'lat': c[0], 'lon': c[1]} for c in coords]
-    
-    step = len(coords) // max_points
-    sampled = coords[::step]
+def sample_coords(coords, max_points: int = 200) -> list:
+    """
+    Sample route coordinates to reduce payload size.
+    Picks at most max_points evenly spaced points, always keeping both ends.
+    """
+    arr = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(arr) > max_points:
+        idx = np.linspace(0, len(arr) - 1, max_points).astype(np.intp)
+        arr = arr[idx]
     
-    return [{'lat': c[0], 'lon': c[1]} for c in sampled]
\ No newline at end of file
+    return [{'lat': lat, 'lon': lon} for lat, lon in arr.tolist()]